@@ -1,15 +1,18 @@
 from __future__ import print_function
 import os, sys, time, shutil
-from functools import partial
+import hashlib
+import itertools
+from functools import partial, wraps
 import multiprocessing as mp
 import numpy as np
-import ruamel_yaml as ry
-import matplotlib.pyplot as plt
 import pandas as pd
-import seaborn as sns
 import fatpack # 3rd party module used for rainflow counting
-
-from scipy.interpolate import PchipInterpolator
+try:
+    from numba import njit # optional, JIT compiles the summary statistics kernel
+except ImportError:
+    njit = None
+# NOTE: matplotlib and scipy are imported in the methods that use them, which keeps the start 
+#       up of spawned batch processing workers fast
 from ROSCO_toolbox.utilities import FAST_IO
 
 from pCrunch import pdTools
@@ -22,6 +25,7 @@ class Loads_Analysis(object):
     Methods:
     --------
     full_loads_analysis
+    full_loads_analysis_iter
     summary_stats
     load_ranking
     fatigue
@@ -53,6 +57,13 @@ class Loads_Analysis(object):
                               ]  # should be same length as ranking_vars
 
         self.DEL_info = None #[('RootMyb1', 10), ('RootMyb2', 10), ('RootMyb3', 10)]
+        # Load and reduce files in parallel? (see full_loads_analysis_iter)
+        #  - where processes are spawned (Windows, macOS), scripts that set this must run from 
+        #    within an `if __name__ == '__main__':` guard
+        self.parallel_analysis = False
+        self.parallel_cores = None  # None/Int>0; if None, uses all available cores
+        # Directory to cache the summary statistics of each file in, None disables caching
+        self.cache_dir = None
         # verbose?
         self.verbose=False
 
@@ -68,11 +79,12 @@ class Loads_Analysis(object):
         '''
         Load openfast data - get statistics - get load ranking - return data
         NOTE: Can be called to run in parallel if get_load_ranking=False (see Processing.batch_processing)
+        NOTE: Files are processed one at a time, see full_loads_analysis_iter
 
         Parameters:
         -------
-        filenames: list
-            List of filenames to load and analyse
+        filenames: list or str
+            List of filenames to load and analyse, or a single filename
         get_load_ranking: bool, optional
             Get the load ranking for all cases
         return_FastData, bool
@@ -87,12 +99,18 @@ class Loads_Analysis(object):
         fast_data: list or dict
             list or dictionary containing OpenFAST output data
         '''
-        # Load openfast data
-        fast_io = FAST_IO()
-        fast_data = fast_io.load_FAST_out(filenames, tmin=self.t0, tmax=self.tf, verbose=self.verbose)
-
-        # Get summary statistics
-        sum_stats = self.summary_stats(fast_data)
+        # Load openfast data and get summary statistics
+        file_stats = []
+        fast_data = []
+        for stats, fd in self.full_loads_analysis_iter(filenames, return_FastData=return_FastData):
+            file_stats.append(stats)
+            fast_data.append(fd)
+
+        # Combine statistics in the order of filenames
+        if len(self.channels_extreme_table) > 0:
+            sum_stats = tuple(_merge_stats(list(parts)) for parts in zip(*file_stats))
+        else:
+            sum_stats = _merge_stats(file_stats)
 
         # Get load rankings
         if get_load_ranking:
@@ -108,7 +126,60 @@ class Loads_Analysis(object):
         else:
             return sum_stats
 
-    def summary_stats(self, fast_data, channel_list=[]):
+    def full_loads_analysis_iter(self, filenames, return_FastData=False):
+        '''
+        Load openfast data and get statistics, one file at a time. Only a single file of OpenFAST 
+        output data is held in memory at once (unless the caller keeps it). 
+        NOTE: If self.parallel_analysis=True, files are loaded and reduced to summary statistics in
+              separate processes. If self.cache_dir is set, the summary statistics of each file are 
+              also saved there and re-used until the file is modified. Neither is supported with 
+              return_FastData or channels_extreme_table. 
+        NOTE: On platforms that spawn, rather than fork, new processes (Windows, macOS), scripts 
+              using parallel_analysis need an `if __name__ == '__main__':` guard, or the workers 
+              fail with a RuntimeError. Inside a daemonic process, e.g. a worker of the 
+              FAST_Processing pools, files are processed serially. 
+
+        Parameters:
+        -------
+        filenames: list or str
+            List of filenames to load and analyse, or a single filename
+        return_FastData, bool
+            Also yield the OpenFAST output data
+
+        Yields:
+        --------
+        sum_stats: dict
+            dictionary of summary statistics for one file (see summary_stats)
+        fast_data: dict or None
+            dictionary containing OpenFAST output data for the file, if return_FastData
+        '''
+        if isinstance(filenames, str):
+            filenames = [filenames]
+
+        if (self.parallel_analysis or self.cache_dir) and not return_FastData \
+                and len(self.channels_extreme_table) == 0:
+            # - daemonic processes (pool workers) are not allowed to have children
+            if self.parallel_analysis and not mp.current_process().daemon:
+                n_cores = self.parallel_cores or os.cpu_count()
+                chunksize = max(1, len(filenames) // (4 * n_cores))
+                with mp.Pool(n_cores) as pool:
+                    for stats in _align_channels(pool.imap(partial(_load_and_stat, self), filenames,
+                                                           chunksize=chunksize)):
+                        yield stats, None
+            else:
+                for stats in _align_channels(_load_and_stat(self, filename) for filename in filenames):
+                    yield stats, None
+        else:
+            # - every file is reduced to the channels of the first one, extra channels are ignored
+            fast_io = FAST_IO()
+            channel_list = None
+            for filename in filenames:
+                fast_data = fast_io.load_FAST_out([filename], tmin=self.t0, tmax=self.tf, verbose=self.verbose)
+                if channel_list is None:
+                    channel_list = tuple(fast_data[0].keys())
+                yield self.summary_stats(fast_data, channel_list=channel_list), (fast_data[0] if return_FastData else None)
+
+    def summary_stats(self, fast_data, channel_list=None):
         '''
         Get summary statistics from openfast output data. 
 
@@ -123,95 +194,86 @@ class Loads_Analysis(object):
         Returns:
         -------
         data_out: dict
-            Dictionary containing summary statistics
+            Dictionary containing summary statistics, as arrays with one value per file
         fast_outdata: dict, optional
             Dictionary of all OpenFAST output data. Only returned if return_data=true
         '''
         sum_stats     = {}
         extreme_table = {}
 
-        for fd in fast_data:
+        # Build channel list if it isn't input
+        #  - resolved once for all files, without Time and meta data
+        save_meta = not channel_list or 'meta' in channel_list
+        if not channel_list:
+            channel_list = fast_data[0].keys()
+        channel_list = tuple(channel for channel in channel_list if channel not in ('Time', 'meta'))
+        channel_set = frozenset(channel_list)
+
+        # save some meta data
+        if save_meta:
+            sum_stats['meta'] = {}
+            sum_stats['meta']['name'] = fast_data[-1]['meta']['name']
+            sum_stats['meta']['filename'] = fast_data[-1]['meta']['filename']
+
+        # Channels to process, including magnitudes of vectors
+        channels = channel_list + tuple(channel for channel in self.channels_magnitude.keys()
+                                        if channel not in channel_set)
+
+        # Stack all channels of all files into one (n_files, n_channels, n_samples) array so each
+        # statistic is a single vectorized reduction. Shorter files are padded with NaN.
+        #  - OpenFAST outputs are written with limited precision, so single precision halves the
+        #    memory traffic for free. Time and the reductions themselves stay in double precision. 
+        lengths = np.array([len(fd['Time']) for fd in fast_data])
+        n_samples = lengths.max()
+        stacked = np.full((len(fast_data), len(channels), n_samples), np.nan, dtype=np.float32)
+        times = np.full((len(fast_data), n_samples), np.nan)
+        for fi, (fd, n_t) in enumerate(zip(fast_data, lengths)):
             if self.verbose:
                 print('Processing data for {}'.format(fd['meta']['name']))
 
-            # Build channel list if it isn't input
-            if channel_list == []:
-                channel_list = list(fd.keys())
-
-            # Process Data
-            for channel in channel_list + list(self.channels_magnitude.keys()):
-                if channel == 'meta':
-                    if 'meta' not in sum_stats.keys():
-                        sum_stats['meta'] = {}
-                        sum_stats['meta']['name'] = []
-                        sum_stats['meta']['filename'] = []
-                    # save some meta data
-                    sum_stats['meta']['name'] = fd['meta']['name']
-                    sum_stats['meta']['filename'] = fd['meta']['filename']
-
-                elif channel != 'Time' and channel in channel_list+list(self.channels_magnitude.keys()):
-                    # try:
-
-                    if channel in channel_list:
-                        y_data = fd[channel]
-                    elif channel in self.channels_magnitude.keys():
-                        # calculate magnitude of a vector
-                        vector = np.array([fd[var] for var in self.channels_magnitude[channel]])
-                        n_dim, n_t = np.shape(vector)
-                        y_data = np.array([np.sqrt(np.sum([vector[i,j]**2. for i in range(n_dim)])) for j in range(n_t)])
-
-                    if channel not in sum_stats.keys():
-                        sum_stats[channel] = {}
-                        sum_stats[channel]['min'] = []
-                        sum_stats[channel]['max'] = []
-                        sum_stats[channel]['std'] = []
-                        sum_stats[channel]['mean'] = []
-                        sum_stats[channel]['abs'] = []
-                        sum_stats[channel]['integrated'] = []
-
-                    # calculate summary statistics
-                    sum_stats[channel]['min'].append(float(min(y_data)))
-                    sum_stats[channel]['max'].append(float(max(y_data)))
-                    sum_stats[channel]['std'].append(float(np.std(y_data)))
-                    sum_stats[channel]['mean'].append(float(np.mean(y_data)))
-                    sum_stats[channel]['abs'].append(float(max(np.abs(y_data))))
-                    sum_stats[channel]['integrated'].append(float(np.trapz(fd['Time'], y_data)))
-
-                    if len(self.channels_extreme_table) > 0:
-                        # outputting user specifed channels at the time where the maximum value occurs
-                        if channel not in extreme_table:
-                            extreme_table[channel] = []
-
-                        extreme_table_i = {}
-                        idx_max = np.argmax(y_data)
-                        for var in self.channels_extreme_table:
-                            extreme_table_i[var] = {}
-                            extreme_table_i[var]['time'] = fd['Time'][idx_max]
-                            extreme_table_i[var]['val']  = fd[var][idx_max]
-                            
-                        extreme_table[channel].append(extreme_table_i)
-
-                    # except ValueError:
-                    #     print('Error loading data from {}.'.format(channel))
-                    # except:
-                    #     print('{} is not in available OpenFAST output data.'.format(channel))
-
-            # if self.channels_magnitude:
-            #     for channel in self.channels_magnitude.keys():
-
-
-            # Add DELS to summary stats
-            if self.DEL_info:
+            times[fi, :n_t] = fd['Time']
+            for ci, channel in enumerate(channels):
+                if channel in channel_set:
+                    stacked[fi, ci, :n_t] = fd[channel]
+                else:
+                    # calculate magnitude of a vector
+                    vector = np.array([fd[var] for var in self.channels_magnitude[channel]])
+                    stacked[fi, ci, :n_t] = np.sqrt(np.sum(vector**2, axis=0))
+
+        # calculate summary statistics
+        #  - the numba kernel is compiled for, and fastest on, C-contiguous arrays
+        #  - re-order to (n_channels, n_stats, n_files), so each statistic is a contiguous array
+        reduced = _channel_stats(np.ascontiguousarray(stacked), np.ascontiguousarray(times), lengths)
+        reduced = np.ascontiguousarray(reduced.transpose(1, 2, 0))
+        for ci, channel in enumerate(channels):
+            sum_stats[channel] = dict(zip(SUMMARY_STATS, reduced[ci]))
+
+        if len(self.channels_extreme_table) > 0:
+            # outputting user specifed channels at the time where the maximum value occurs
+            idx_max = np.nanargmax(stacked, axis=-1)
+            for ci, channel in enumerate(channels):
+                extreme_table[channel] = []
+                for fi, fd in enumerate(fast_data):
+                    extreme_table_i = {}
+                    for var in self.channels_extreme_table:
+                        extreme_table_i[var] = {}
+                        extreme_table_i[var]['time'] = fd['Time'][idx_max[fi, ci]]
+                        extreme_table_i[var]['val']  = fd[var][idx_max[fi, ci]]
+
+                    extreme_table[channel].append(extreme_table_i)
+
+        # Add DELS to summary stats
+        if self.DEL_info:
+            for fi, fd in enumerate(fast_data):
                 for channel, m in self.DEL_info:
-                    if channel not in sum_stats.keys():
+                    if channel not in sum_stats:
                         print('Cannot get DELs for {} because it does not exist in output data.'.format(channel))
                         break
-                    if 'DEL' not in sum_stats[channel].keys():
-                        sum_stats[channel]['DEL'] = []
-                    
-                    dfDEL = self.get_DEL([fd], [(channel, m)], t=fd['Time'][-1])
-                    sum_stats[channel]['DEL'].append(float(dfDEL[channel][0]))
+                    if 'DEL' not in sum_stats[channel]:
+                        sum_stats[channel]['DEL'] = np.empty(len(fast_data))
 
+                    dfDEL = self.get_DEL([fd], [(channel, m)], t=fd['Time'][-1])
+                    sum_stats[channel]['DEL'][fi] = dfDEL[channel][0]
 
         if len(self.channels_extreme_table) > 0:
             return sum_stats, extreme_table
@@ -262,49 +324,62 @@ class Loads_Analysis(object):
         if self.verbose:
             print('Calculating load rankings.')
             
-        # Column names to search in stats_df
-        #  - [name, variable, stat],  i.e.['DLC1.1','TwrBsFxt','max']
-        cnames = [pd.MultiIndex.from_product([names, var, [stat]])
-                for var, stat in zip(self.ranking_vars, self.ranking_stats)]
-
         rank__ascending = False
         # Collect load rankings
         collected_rankings = []
-        for col in cnames:
+        for var, stat in zip(self.ranking_vars, self.ranking_stats):
+            # Column names to search in stats_df, and their positions
+            #  - [name, variable, stat],  i.e.['DLC1.1','TwrBsFxt','max']
+            col = list(itertools.product(names, var, [stat]))
+            col_idx = stats_df.columns.get_indexer(col)
+
             # Set column names for dataframe
-            mi_name = list(col.levels[0])
-            mi_stat = col.levels[2]  # length = 1
-            mi_idx = col.levels[2][0] + '_case_idx'
-            if len(col.levels[1]) > 1:
-                mi_var = [col.levels[1][0][:-1]]
+            mi_name = sorted(set(names))
+            mi_idx = stat + '_case_idx'
+            if len(set(var)) > 1:
+                mi_var = [min(var)[:-1]]
             else:
-                mi_var = list(col.levels[1])
-            mi_colnames = pd.MultiIndex.from_product([mi_name, mi_var, [mi_idx, mi_stat[0]]])
+                mi_var = [var[0]]
+            mi_colnames = pd.MultiIndex.from_product([mi_name, mi_var, [mi_idx, stat]])
 
             # Check for valid stats
-            for c in col:
-                if c not in list(stats_df.columns.values):
-                    print('WARNING: {} does not exist in statistics.'.format(c))
-                    col = col.drop(c)
-                    # raise ValueError('{} does not exist in statistics'.format(c))
+            for c in itertools.compress(col, col_idx == -1):
+                print('WARNING: {} does not exist in statistics.'.format(c))
+                # raise ValueError('{} does not exist in statistics'.format(c))
+            col_names = [c[0] for c in itertools.compress(col, col_idx != -1)]
+            col_idx = col_idx[col_idx != -1]
             # Go to next case if no [stat, var] exists in this set
-            if len(col) == 0:
+            if len(col_idx) == 0:
                 continue
             # Extract desired variables from stats dataframe
-            if mi_stat in ['max', 'abs']:
-                var_df = stats_df[col].max(axis=1, level=0)
+            if stat in ['max', 'abs']:
+                reduce_vars = np.nanmax
                 rank__ascending = False
-            elif mi_stat in ['min']:
-                var_df = stats_df[col].min(axis=1, level=0)
+            elif stat in ['min']:
+                reduce_vars = np.nanmin
                 rank__ascending = True
-            elif mi_stat in ['mean', 'std']:
-                var_df = stats_df[col].mean(axis=1, level=0)
+            elif stat in ['mean', 'std']:
+                reduce_vars = np.nanmean
                 rank__ascending = False
-
-            # Combine ranking dataframes for each dataset
-            var_df_list = [var_df[column].sort_values(
-                ascending=rank__ascending).reset_index() for column in var_df.columns]
-            single_lr = pd.concat(var_df_list, axis=1)
+            #  - pandas hands back column-major arrays, make them row-major for the row-wise reductions
+            block = np.ascontiguousarray(stats_df.iloc[:, col_idx].to_numpy(dtype=np.float64))
+
+            # Reduce the variables of each dataset
+            #  - col is ordered by dataset, so each dataset is a contiguous slice of columns
+            _, ds_start, ds_count = np.unique(col_names, return_index=True, return_counts=True)
+            values = np.column_stack([reduce_vars(block[:, start:start + count], axis=1)
+                                      for start, count in zip(ds_start, ds_count)])
+
+            # Rank the cases of all datasets with a single sort (NaNs are placed last)
+            order = np.argsort(values if rank__ascending else -values, axis=0, kind='stable')
+            ranked_vals = np.take_along_axis(values, order, axis=0)
+            ranked_idx = stats_df.index.values[order]
+
+            # Combine [case index, value] columns for each dataset
+            ranked_columns = []
+            for di in range(values.shape[1]):
+                ranked_columns += [ranked_idx[:, di], ranked_vals[:, di]]
+            single_lr = pd.DataFrame(dict(enumerate(ranked_columns)))
             single_lr.columns = mi_colnames
             collected_rankings.append(single_lr)
 
@@ -416,8 +491,8 @@ class Power_Production(object):
             type of probability, currently supports CDF or PDF
         Outputs:
         ----------
-        p_bin: list
-            list containing probabilities per wind speed bin 
+        p_bin: ndarray
+            array containing probabilities per wind speed bin 
         '''
         if self.turbine_class in [1, 'I']:
             Vavg = 50 * 0.2
@@ -430,12 +505,15 @@ class Power_Production(object):
         k = 2 # Weibull shape parameter
         c = (2 * Vavg)/np.sqrt(np.pi) # Weibull scale parameter 
 
+        # Evaluate all wind speeds at once
+        V_c = np.asarray(windspeed, dtype=np.float64) / c
+
         if disttype.lower() == 'cdf':
             # Calculate probability of wind speed based on WeibulCDF
-            wind_prob = 1 - np.exp(-(windspeed/c)**k)
+            wind_prob = 1 - np.exp(-V_c**k)
         elif disttype.lower() == 'pdf':
             # Calculate probability of wind speed based on WeibulPDF
-            wind_prob = (k/c) * (windspeed/c)**(k-1) * np.exp(-(windspeed/c)**k)
+            wind_prob = (k/c) * V_c**(k-1) * np.exp(-V_c**k)
         else:
             raise ValueError('The {} probability distribution type is invalid'.format(disttype))
         
@@ -489,19 +567,15 @@ class Power_Production(object):
                 'Length of windspeeds is not the correct length for the input statistics.')
 
         # load power array
-        if 'GenPwr' in stats_df.columns.levels[0]:
-            pwr_array = stats_df.loc[:, ('GenPwr', 'mean')]
-            pwr_array = pwr_array.to_frame()
-        elif 'GenPwr' in stats_df.columns.levels[1]:
-            pwr_array = stats_df.loc[:, (slice(None), 'GenPwr', 'mean')]
-        else:
+        #  - ('GenPwr', 'mean') are the last two column levels for both single and multiple datasets
+        pwr_idx = np.flatnonzero((stats_df.columns.get_level_values(-2) == 'GenPwr')
+                                 & (stats_df.columns.get_level_values(-1) == 'mean'))
+        if len(pwr_idx) == 0:
             raise ValueError("('GenPwr','Mean') does not exist in the input statistics.")
+        pwr_array = np.ascontiguousarray(stats_df.iloc[:, pwr_idx].to_numpy(dtype=np.float64))
         
-        # group and average powers by wind speeds
-        pwr_array['windspeeds'] = ws 
-        pwr_array = pwr_array.groupby('windspeeds').mean() 
-        # find set of wind speeds
-        ws_set = list(set(ws))
+        # group and average powers by wind speeds, and find set of wind speeds
+        ws_set, pwr_array = _mean_by_windspeed(ws, pwr_array)
         # wind probability
         wind_prob = self.prob_WindDist(ws_set, disttype='pdf')
         # Calculate AEP
@@ -529,6 +603,7 @@ class Power_Production(object):
                 perf_array = perf_array.groupby('windspeeds').mean()
 
                 if len(U_pwr_curve) > 0:
+                    from scipy.interpolate import PchipInterpolator
                     spline = PchipInterpolator(ws_set, perf_array[var])
                     performance_curves[var] = spline(performance_curves['U']).flatten()
                 else:
@@ -573,6 +648,7 @@ class wsPlotting(object):
         fig: figure handle
         ax: axes handle
         '''
+        import matplotlib.pyplot as plt
 
         # Check for valid inputs
         if isinstance(stats, dict):
@@ -605,12 +681,9 @@ class wsPlotting(object):
         else:
             raise ValueError("{} does not exist in the input statistics.".format(plotvar))
         
-        # Add windspeeds to data
-        sdf['WindSpeeds']= ws
         # Group by windspeed and average each statistic (for multiple seeds)
-        sdf = sdf.groupby('WindSpeeds').mean() 
-        # Final wind speed values
-        pl_windspeeds=sdf.index.values
+        pl_windspeeds, sdf_means = _mean_by_windspeed(ws, sdf.to_numpy(dtype=np.float64))
+        sdf = pd.DataFrame(sdf_means, index=pd.Index(pl_windspeeds, name='WindSpeeds'), columns=sdf.columns)
 
         if plottype == 'bar':
             # Define mean and std dataframes
@@ -662,6 +735,9 @@ class wsPlotting(object):
         fig: figure handle
         ax: axes handle
         '''
+        import matplotlib.pyplot as plt
+        from scipy.stats import gaussian_kde
+
         # Make sure input types allign
         if isinstance(fast_data, dict):
             fd = [fast_data]
@@ -680,15 +756,23 @@ class wsPlotting(object):
         for channel in channels:
             fig, ax = plt.subplots()
             for idx, data in enumerate(fd):
-                # sns.kdeplot(data[channel], shade=True, label='case '+ str(idx))
-                sns.distplot(data[channel], kde=kde, label='case ' + str(idx))  # For a histogram
+                color = 'C{}'.format(idx)
+                label = names[idx] if names else 'case ' + str(idx)
+                # Histogram, normalized to a probability density
+                counts, edges = np.histogram(data[channel], bins=100, density=True)
+                ax.stairs(counts, edges, fill=True, alpha=0.4, color=color, label=label)
+                if kde and np.ptp(data[channel]) > 0:
+                    # Kernel density estimate from (at most ~5000 samples of) the data
+                    stride = max(1, len(data[channel]) // 5000)
+                    grid = np.linspace(edges[0], edges[-1], 256)
+                    ax.plot(grid, gaussian_kde(data[channel][::stride])(grid), color=color)
                 ax.set_title(channel + ' distribution')
 
                 units = data['meta']['attribute_units'][data['meta']['channels'].index(channel)]
                 ax.set_xlabel('{} [{}]'.format(channel, units))
                 ax.grid(True)
             if names:
-                ax.legend(names)
+                ax.legend()
                 
         return fig, ax
 
@@ -720,6 +804,7 @@ class wsPlotting(object):
 
         TODO: Save figs
         '''
+        import matplotlib.pyplot as plt
 
         # flag_DLC_name = False
         # n_rankings = 10
@@ -821,3 +906,273 @@ class wsPlotting(object):
 
 
         return fig_list, ax_list
+
+
+# ------------------ Statistics helpers ------------------ #
+def _mean_by_windspeed(windspeeds, values):
+    '''
+    Average rows of values that share a wind speed (e.g. multiple seeds). Equivalent to a 
+    groupby-mean, but accumulated with np.add.at rather than through pandas groupby. 
+
+    Parameters:
+    -----------
+    windspeeds: list-like
+        (n_cases,) wind speed of each case
+    values: ndarray
+        (n_cases, n_columns) values to average
+
+    Returns:
+    --------
+    ws_set: ndarray
+        (n_windspeeds,) sorted unique wind speeds
+    means: ndarray
+        (n_windspeeds, n_columns) average values at each wind speed
+    '''
+    ws_set, ws_idx = np.unique(windspeeds, return_inverse=True)
+    sums = np.zeros((len(ws_set), values.shape[1]))
+    np.add.at(sums, ws_idx, values)
+
+    return ws_set, sums / np.bincount(ws_idx)[:, np.newaxis]
+
+
+# ------------------ File by file processing ------------------ #
+CACHE_VERSION = 1 # bump when the layout or math of the summary statistics changes
+
+def _cache_stats(func):
+    '''
+    Decorator to memoize the summary statistics of single OpenFAST output files on disk, 
+    in loads_analysis.cache_dir. Entries are keyed on the file path and modification time, 
+    the analysis settings that change the statistics, and CACHE_VERSION. 
+    '''
+    @wraps(func)
+    def wrapper(loads_analysis, filename):
+        if not loads_analysis.cache_dir:
+            return func(loads_analysis, filename)
+
+        key = repr((CACHE_VERSION, os.path.abspath(filename), os.path.getmtime(filename),
+                    loads_analysis.t0, loads_analysis.tf,
+                    loads_analysis.channels_magnitude, loads_analysis.DEL_info))
+        cache_file = os.path.join(loads_analysis.cache_dir,
+                                  hashlib.blake2b(key.encode(), digest_size=16).hexdigest() + '.npz')
+
+        if os.path.exists(cache_file):
+            if loads_analysis.verbose:
+                print('Loading cached statistics for {}'.format(filename))
+            with np.load(cache_file) as cached:
+                return _npz2stats(cached)
+
+        sum_stats = func(loads_analysis, filename)
+
+        # write to a temporary file first, so parallel workers never read a partial cache file
+        os.makedirs(loads_analysis.cache_dir, exist_ok=True)
+        tmp_file = '{}.{}.tmp'.format(cache_file, os.getpid())
+        with open(tmp_file, 'wb') as f:
+            np.savez_compressed(f, **_stats2npz(sum_stats))
+        os.replace(tmp_file, cache_file)
+
+        return sum_stats
+
+    return wrapper
+
+def _stats2npz(sum_stats):
+    '''
+    Flatten summary statistics to {'channel/stat': array}, for np.savez
+    '''
+    return {'{}/{}'.format(channel, stat): np.asarray(values)
+            for channel, channel_stats in sum_stats.items()
+            for stat, values in channel_stats.items()}
+
+def _npz2stats(npz):
+    '''
+    Rebuild summary statistics from an npz file saved with _stats2npz
+    '''
+    sum_stats = {}
+    for key in npz.files:
+        channel, stat = key.rsplit('/', 1)
+        # - meta data is saved as 0-d string arrays
+        value = npz[key]
+        sum_stats.setdefault(channel, {})[stat] = value.item() if value.ndim == 0 else value
+
+    return sum_stats
+
+@_cache_stats
+def _load_and_stat(loads_analysis, filename):
+    '''
+    Load a single OpenFAST output file and reduce it to summary statistics. 
+    Module level so it can be dispatched to a multiprocessing pool. 
+
+    Parameters:
+    -----------
+    loads_analysis: Loads_Analysis
+        analysis settings (time range, channels, DELs, ...)
+    filename: str
+        OpenFAST output file to process
+
+    Returns:
+    --------
+    sum_stats: dict
+        dictionary of summary statistics for the file
+    '''
+    fast_io = FAST_IO()
+    fast_data = fast_io.load_FAST_out([filename], tmin=loads_analysis.t0, tmax=loads_analysis.tf, 
+                                      verbose=loads_analysis.verbose)
+
+    return loads_analysis.summary_stats(fast_data)
+
+def _align_channels(stats_iter):
+    '''
+    Reduce the summary statistics of single files to the channels of the first file, as 
+    summary_stats does when given several files. Extra channels are ignored. 
+
+    Parameters:
+    -----------
+    stats_iter: iterable
+        dictionaries of summary statistics, one per file, in file order
+
+    Yields:
+    --------
+    sum_stats: dict
+        dictionary of summary statistics for one file, with the channels of the first file
+    '''
+    channels = None
+    for sum_stats in stats_iter:
+        if channels is None:
+            channels = tuple(sum_stats.keys())
+        missing = [channel for channel in channels if channel not in sum_stats]
+        if missing:
+            raise KeyError('Channels {} are not in the output data of {}'.format(
+                missing, sum_stats['meta']['filename']))
+
+        yield {channel: sum_stats[channel] for channel in channels}
+
+def _merge_stats(stats_list):
+    '''
+    Combine the summary statistics (or extreme tables) of consecutive sets of files. Arrays and 
+    lists are concatenated, nested dictionaries merged, and anything else (meta data) is taken 
+    from the last set. 
+
+    Parameters:
+    -----------
+    stats_list: list
+        list of dictionaries of summary statistics, in file order
+
+    Returns:
+    --------
+    sum_stats: dict
+        dictionary of combined summary statistics
+    '''
+    sum_stats = {}
+    keys = dict.fromkeys(key for stats in stats_list for key in stats)
+    for key in keys:
+        values = [stats[key] for stats in stats_list if key in stats]
+        # - a key missing from some sets would misalign the values with the files
+        if len(values) != len(stats_list):
+            raise KeyError('{} is not in the statistics of every file'.format(key))
+        if isinstance(values[0], dict):
+            sum_stats[key] = _merge_stats(values)
+        elif isinstance(values[0], np.ndarray):
+            sum_stats[key] = np.concatenate(values)
+        elif isinstance(values[0], list):
+            sum_stats[key] = list(itertools.chain.from_iterable(values))
+        else:
+            sum_stats[key] = values[-1]
+
+    return sum_stats
+
+
+# ------------------ Summary statistics kernels ------------------ #
+# Order of the statistics along the last axis of the _channel_stats output
+SUMMARY_STATS = ['min', 'max', 'std', 'mean', 'abs', 'integrated']
+
+def _channel_stats_numpy(stacked, times, lengths):
+    '''
+    Summary statistics of stacked channel data using vectorized NumPy reductions
+
+    Parameters:
+    -----------
+    stacked: ndarray
+        (n_files, n_channels, n_samples) float32 channel data, NaN padded past the end of each file
+    times: ndarray
+        (n_files, n_samples) time vectors, NaN padded past the end of each file
+    lengths: ndarray
+        (n_files,) number of valid samples in each file
+
+    Returns:
+    --------
+    stats: ndarray
+        (n_files, n_channels, len(SUMMARY_STATS)) summary statistics
+    '''
+    # - max(|y|) == max(-min(y), max(y)), so |y| is never materialized
+    mins = np.nanmin(stacked, axis=-1)
+    maxs = np.nanmax(stacked, axis=-1)
+
+    # Reduce the unpadded samples of each file, for all of its channels at once
+    #  - mean and std from E[y] and E[y^2], einsum forms the sum of squares without a temporary y^2 array
+    #  - trapezoidal integrals of all channels as matrix-vector products with the shared time steps
+    means = np.empty(mins.shape)
+    stds = np.empty(mins.shape)
+    integrated = np.empty(mins.shape)
+    for fi, n_t in enumerate(lengths):
+        y = stacked[fi, :, :n_t]
+        means[fi] = y.sum(axis=-1, dtype=np.float64) / n_t
+        mean_sq = np.einsum('ij,ij->i', y, y, dtype=np.float64) / n_t
+        stds[fi] = np.sqrt(np.maximum(mean_sq - means[fi]**2, 0.0))
+
+        dt = np.diff(times[fi, :n_t])
+        integrated[fi] = 0.5 * (y[:, 1:] @ dt + y[:, :-1] @ dt)
+
+    return np.stack([mins,
+                     maxs,
+                     stds,
+                     means,
+                     np.maximum(-mins, maxs),
+                     integrated], axis=-1)
+
+def _channel_stats_loop(stacked, times, lengths):
+    '''
+    Summary statistics of stacked channel data in a single pass through each channel. 
+    Meant to be compiled with numba, see _channel_stats_numpy for inputs and outputs. 
+    '''
+    n_files, n_channels, _ = stacked.shape
+    stats = np.empty((n_files, n_channels, 6))
+    for fi in range(n_files):
+        n_t = lengths[fi]
+        dt = np.diff(times[fi, :n_t]) # shared by all channels of the file
+        for ci in range(n_channels):
+            y = stacked[fi, ci]
+            y_min = y[0]
+            y_max = y[0]
+            shift = np.float64(y[0]) # sums of the shifted data avoid cancellation in the variance
+            sum_y = 0.0
+            sum_y2 = 0.0
+            integrated = 0.0
+            y_prev = shift
+            for i in range(n_t):
+                yi = np.float64(y[i])
+                if yi < y_min:
+                    y_min = yi
+                if yi > y_max:
+                    y_max = yi
+                d = yi - shift
+                sum_y += d
+                sum_y2 += d * d
+                if i > 0:
+                    integrated += 0.5 * (yi + y_prev) * dt[i-1]
+                y_prev = yi
+
+            mean_d = sum_y / n_t
+            stats[fi, ci, 0] = y_min
+            stats[fi, ci, 1] = y_max
+            stats[fi, ci, 2] = np.sqrt(max(sum_y2 / n_t - mean_d * mean_d, 0.0))
+            stats[fi, ci, 3] = shift + mean_d
+            stats[fi, ci, 4] = max(-y_min, y_max)
+            stats[fi, ci, 5] = integrated
+
+    return stats
+
+# - compiled serial: files are already spread over processes by the batch processing pools, 
+#   and the numba threading layers are not fork-safe
+if njit is not None:
+    _channel_stats = njit(cache=True, fastmath=True)(_channel_stats_loop)
+else:
+    _channel_stats = _channel_stats_numpy
@@ -12,7 +12,6 @@ except:
     except:
         raise ImportError('No module named ruamel.yaml or ruamel_yaml')
 
-import matplotlib.pyplot as plt
 import pandas as pd
 
 from ROSCO_toolbox.utilities import FAST_IO
@@ -403,6 +402,8 @@ def save_yaml(outdir, fname, data_out):
     yaml.default_flow_style = None
     yaml.width = float("inf")
     yaml.indent(mapping=4, sequence=6, offset=3)
+    # summary statistics are stored as numpy arrays
+    yaml.representer.add_representer(np.ndarray, lambda representer, data: representer.represent_list(data.tolist()))
     yaml.dump(data_out, f)
 
 
@@ -36,12 +36,11 @@ VERSION = '0.1.1'
 # These packages are required for all of the code to be executed. 
 # - Maybe you can get away with older versions...
 REQUIRED = [
-    'matplotlib',
+    'matplotlib>=3.4',
     'numpy',
     'pytest',
     'scipy',
     'pyYAML',
-    'seaborn',
     'fatpack'
 ]
 